@@ -1,11 +1,17 @@
+import asyncio
+import logging
 import os
+import uuid
+from functools import lru_cache
 from datetime import date as Date, time as Time, datetime, timedelta
 from urllib.parse import urlencode, quote_plus
-import resend
 from dotenv import load_dotenv
+from httpx import AsyncClient, HTTPStatusError, TransportError
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
 FROM_EMAIL     = os.getenv("FROM_EMAIL")  # e.g. "The Rambling House <noreply@yourdomain.ie>"
 _admin_env     = os.getenv("ADMIN_EMAILS") or os.getenv("ADMIN_EMAIL") or ""
@@ -17,7 +23,22 @@ if not RESEND_API_KEY or not FROM_EMAIL:
 # Debug: confirm who will receive admin emails
 print("ADMIN_RECIPIENTS:", ADMIN_RECIPIENTS)
 
-resend.api_key = RESEND_API_KEY
+# Resend REST API (called directly on the shared httpx pool, see email_worker)
+RESEND_BATCH_URL = "https://api.resend.com/emails/batch"
+RESEND_HEADERS = {"Authorization": f"Bearer {RESEND_API_KEY}"}
+RESEND_MAX_RPS = int(os.getenv("RESEND_MAX_RPS") or 2)   # Resend's default per-team limit
+# The bucket below is per process, but Resend's limit is per team: under `uvicorn --workers N`
+# set RESEND_WORKERS=N (defaults to WEB_CONCURRENCY) so each process sends at most RESEND_MAX_RPS / N.
+RESEND_WORKERS = int(os.getenv("RESEND_WORKERS") or os.getenv("WEB_CONCURRENCY") or 1)
+_RATE_WINDOW = float(RESEND_WORKERS)                    # seconds each send holds a bucket slot
+RESEND_MAX_ATTEMPTS = 3                                 # retries cover 429, 5xx and network errors
+EMAIL_CONSUMERS = 4                                     # batches in flight, so one retrying event can't stall the rest
+
+print(f"Resend rate limit: {RESEND_MAX_RPS / RESEND_WORKERS:g} req/s in this process "
+      f"({RESEND_MAX_RPS} req/s across {RESEND_WORKERS} worker(s))")
+
+# Outgoing emails waiting for email_worker; one item per event (customer + admin copies)
+_email_queue: asyncio.Queue[list[dict]] = asyncio.Queue(maxsize=1000)
 
 # ---------- Brand / Styles ----------
 BRAND_NAME = "The Rambling House Bar & Restaurant"
@@ -34,19 +55,59 @@ ADDRESS_BLOCK = (
     "Tel: +353 0749740813 &nbsp;&nbsp; Mob: +353 0852533832"
 )
 
+# Hidden preview line many email clients show next to the subject
+_PREHEADER_TMPL = (
+    "<span style='display:none!important;opacity:0;color:transparent;height:0;width:0;overflow:hidden;'>{}</span>"
+).format
+
 def _preheader(text: str) -> str:
-    # Hidden preview line many email clients show next to the subject
-    return f"<span style='display:none!important;opacity:0;color:transparent;height:0;width:0;overflow:hidden;'>{text}</span>"
+    return _PREHEADER_TMPL(text)
+
+_WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+_MONTHS = (
+    "", "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+)
+_MONTH_DAYS = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+# hour (0-23) -> (12h hour, AM/PM)
+_HOUR12 = tuple((h % 12 or 12, "AM" if h < 12 else "PM") for h in range(24))
+
+def _fmt_date_fast(s: str) -> str:
+    """Format a "YYYY-MM-DD" string like "Thursday, 15 October 2026" without building a date."""
+    if len(s) != 10 or s[4] != "-" or s[7] != "-":
+        raise ValueError(s)
+    y = int(s[0:4]); m = int(s[5:7]); d = int(s[8:10])
+    leap = y % 4 == 0 and (y % 100 != 0 or y % 400 == 0)
+    if not (1 <= m <= 12 and 1 <= d <= _MONTH_DAYS[m] - (m == 2 and not leap)):
+        raise ValueError(s)
+    # Zeller's congruence (0 = Saturday); Jan/Feb count as months 13/14 of the previous year
+    zm = m + 12 * (m < 3)
+    zy = y - (m < 3)
+    k, j = zy % 100, zy // 100
+    h = (d + 13 * (zm + 1) // 5 + k + k // 4 + j // 4 + 5 * j) % 7
+    return f"{_WEEKDAYS[(h + 5) % 7]}, {s[8:10]} {_MONTHS[m]} {s[0:4]}"
+
+def _fmt_time_fast(s: str) -> str:
+    """Format a "HH:MM" / "HH:MM:SS" string like "7:30 PM"."""
+    if len(s) < 5 or s[2] != ":":
+        raise ValueError(s)
+    h12, suf = _HOUR12[int(s[0:2])]
+    return f"{h12}:{int(s[3:5]):02d} {suf}"
 
 def _fmt_date(v) -> str:
     if not v:
         return ""
     if isinstance(v, Date):
         return v.strftime("%A, %d %B %Y")
+    s = str(v)
     try:
-        return Date.fromisoformat(str(v)).strftime("%A, %d %B %Y")
+        return _fmt_date_fast(s)
+    except ValueError:
+        pass
+    try:
+        return Date.fromisoformat(s).strftime("%A, %d %B %Y")
     except Exception:
-        return str(v)
+        return s
 
 def _fmt_time(v) -> str:
     if not v:
@@ -54,6 +115,10 @@ def _fmt_time(v) -> str:
     if isinstance(v, Time):
         return v.strftime("%I:%M %p").lstrip("0")
     s = str(v)
+    try:
+        return _fmt_time_fast(s)
+    except (ValueError, IndexError):
+        pass
     parts = s.split(":")
     try:
         h = int(parts[0]); m = int(parts[1]) if len(parts) > 1 else 0
@@ -66,6 +131,7 @@ def _fmt_time(v) -> str:
 def _s(v) -> str:
     return "" if v is None else str(v)
 
+@lru_cache(maxsize=2048)
 def _ref(res_id: str | None) -> str:
     if not res_id:
         return "—"
@@ -90,28 +156,6 @@ def _start_end_strings(r: dict, duration_minutes: int = 120) -> tuple[str, str]:
             # give empty; Google will let user fill
             return ("", "")
 
-def _gcal_link(r: dict) -> str:
-    start, end = _start_end_strings(r)
-    params = {
-        "action": "TEMPLATE",
-        "text": f"Reservation — {BRAND_NAME}",
-        "details": (
-            "Your booking at The Rambling House.\n\n"
-            f"Name: {_s(r.get('name'))}\n"
-            f"Guests: {_s(r.get('guests'))}\n"
-            f"Reference: {_ref(r.get('id'))}\n"
-            "If your plans change, please let us know."
-        ),
-        "location": "The Rambling House, Main street Laghy, Co. Donegal F94Y048",
-    }
-    if start and end:
-        params["dates"] = f"{start}/{end}"
-    return "https://calendar.google.com/calendar/render?" + urlencode(params, quote_via=quote_plus)
-
-def _maps_link() -> str:
-    q = "The Rambling House Laghy F94Y048"
-    return "https://www.google.com/maps/search/?" + urlencode({"api": "1", "query": q}, quote_via=quote_plus)
-
 def _button(href: str, label: str, bg=ACCENT, color="#ffffff"):
     return (
         f"<a href='{href}' "
@@ -120,39 +164,53 @@ def _button(href: str, label: str, bg=ACCENT, color="#ffffff"):
         f"{label}</a>"
     )
 
-def _details_table(r: dict) -> str:
-    rows = [
-        ("Reservation name",   _s(r.get("name"))),
-        ("Guests",             _s(r.get("guests"))),
-        ("Date",               _fmt_date(r.get("date"))),
-        ("Time",               _fmt_time(r.get("time"))),
-        ("Contact email",      _s(r.get("email"))),
-        ("Phone",              _s(r.get("phone"))),
-        ("Occasion",           _s(r.get("occasion")) or "—"),
-        ("Special requests",   _s(r.get("special_requests")) or "—"),
-        ("Reference",          _ref(r.get("id"))),
-        ("Status",             _s(r.get("status")) or "—"),
-    ]
-    trs = "".join(
-        f"""
-        <tr>
-          <td style="padding:10px 12px;border-bottom:1px solid {BORDER};color:{MUTED};width:180px;font-weight:600;">{label}</td>
-          <td style="padding:10px 12px;border-bottom:1px solid {BORDER};color:{TEXT};">{value}</td>
-        </tr>
-        """ for label, value in rows
+# Static links: only the dates and details of a calendar invite vary per reservation
+_GCAL_BASE = "https://calendar.google.com/calendar/render?" + urlencode(
+    {
+        "action": "TEMPLATE",
+        "text": f"Reservation — {BRAND_NAME}",
+        "location": "The Rambling House, Main street Laghy, Co. Donegal F94Y048",
+    },
+    quote_via=quote_plus,
+)
+_MAPS_LINK = "https://www.google.com/maps/search/?" + urlencode(
+    {"api": "1", "query": "The Rambling House Laghy F94Y048"}, quote_via=quote_plus
+)
+_MAPS_BUTTON_HTML = _button(_MAPS_LINK, "Get Directions", bg="#0a5a36")
+
+def _gcal_link(r: dict) -> str:
+    start, end = _start_end_strings(r)
+    details = (
+        "Your booking at The Rambling House.\n\n"
+        f"Name: {_s(r.get('name'))}\n"
+        f"Guests: {_s(r.get('guests'))}\n"
+        f"Reference: {_ref(r.get('id'))}\n"
+        "If your plans change, please let us know."
     )
-    return f"""
-    <table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px solid {BORDER};border-radius:12px;overflow:hidden;background:{BG}">
-      <tbody>{trs}</tbody>
-    </table>
-    """
+    dates = f"&dates={quote_plus(f'{start}/{end}')}" if start and end else ""
+    return f"{_GCAL_BASE}&details={quote_plus(details)}{dates}"
 
-def _wrapper_html(title: str, preheader: str, intro_html: str, details_html: str, badge: str = "", extra_footer: str = "") -> str:
-    return f"""
+# ---------- Precompiled templates (brand/colors baked in at import) ----------
+_ROW_TMPL = (
+    f'<tr><td style="padding:10px 12px;border-bottom:1px solid {BORDER};color:{MUTED};width:180px;font-weight:600;">{{label}}</td>'
+    f'<td style="padding:10px 12px;border-bottom:1px solid {BORDER};color:{TEXT};">{{value}}</td></tr>'
+).format
+
+_TABLE_TMPL = (
+    f'<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px solid {BORDER};border-radius:12px;overflow:hidden;background:{BG}">'
+    "<tbody>{rows}</tbody>"
+    "</table>"
+).format
+
+_BADGE_TMPL = (
+    '<div style="margin-top:8px;display:inline-block;background:rgba(255,255,255,.18);padding:6px 10px;border-radius:999px;font-size:12px;">{}</div>'
+).format
+
+_WRAPPER_TMPL = f"""
 <!doctype html>
 <html>
   <body style="margin:0;padding:0;background:#f7f7f7;">
-    {_preheader(preheader)}
+    {{preheader}}
     <table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="background:#f7f7f7;">
       <tr>
         <td style="padding:32px 16px;">
@@ -160,17 +218,17 @@ def _wrapper_html(title: str, preheader: str, intro_html: str, details_html: str
             <tr>
               <td style="padding:20px 24px;background:{ACCENT};color:#fff;font-family:Arial, Helvetica, sans-serif;">
                 <div style="font-size:13px;opacity:.9;letter-spacing:.08em;text-transform:uppercase;">{BRAND_NAME}</div>
-                <div style="font-size:22px;font-weight:700;margin-top:4px;">{title}</div>
-                {f'<div style="margin-top:8px;display:inline-block;background:rgba(255,255,255,.18);padding:6px 10px;border-radius:999px;font-size:12px;">{badge}</div>' if badge else ''}
+                <div style="font-size:22px;font-weight:700;margin-top:4px;">{{title}}</div>
+                {{badge_html}}
               </td>
             </tr>
             <tr>
               <td style="padding:24px;font-family:Arial, Helvetica, sans-serif;color:{TEXT};">
-                {intro_html}
+                {{intro_html}}
                 <div style="height:16px;"></div>
-                {details_html}
+                {{details_html}}
                 <div style="height:16px;"></div>
-                {extra_footer}
+                {{extra_footer}}
               </td>
             </tr>
             <tr>
@@ -184,57 +242,169 @@ def _wrapper_html(title: str, preheader: str, intro_html: str, details_html: str
     </table>
   </body>
 </html>
-    """
+""".format
+
+# Whole details table with labels baked in; only the ten values are substituted per email
+_DETAILS_TMPL = _TABLE_TMPL(rows="".join(
+    _ROW_TMPL(label=label, value="{%s}" % field) for label, field in (
+        ("Reservation name",   "name"),
+        ("Guests",             "guests"),
+        ("Date",               "date"),
+        ("Time",               "time"),
+        ("Contact email",      "email"),
+        ("Phone",              "phone"),
+        ("Occasion",           "occasion"),
+        ("Special requests",   "special_requests"),
+        ("Reference",          "ref"),
+        ("Status",             "status"),
+    )
+)).format
+
+def _details_table(r: dict) -> str:
+    get = r.get
+    return _DETAILS_TMPL(
+        name=get("name") or "",
+        guests=get("guests") or "",
+        date=_fmt_date(get("date")),
+        time=_fmt_time(get("time")),
+        email=get("email") or "",
+        phone=get("phone") or "",
+        occasion=get("occasion") or "—",
+        special_requests=get("special_requests") or "—",
+        ref=_ref(get("id")),
+        status=get("status") or "—",
+    )
 
-def _send(to_emails, subject: str, html: str, text_fallback: str = ""):
+def _wrapper_html(title: str, preheader: str, intro_html: str, details_html: str, badge: str = "", extra_footer: str = "") -> str:
+    return _WRAPPER_TMPL(
+        title=title,
+        preheader=_preheader(preheader),
+        badge_html=_BADGE_TMPL(badge) if badge else "",
+        intro_html=intro_html,
+        details_html=details_html,
+        extra_footer=extra_footer,
+    )
+
+def _email(to_emails, subject: str, html: str, text_fallback: str = "") -> dict:
     if isinstance(to_emails, str):
         to_emails = [to_emails]
-    params = {
+    return {
         "from": FROM_EMAIL,
         "to": to_emails,
         "subject": subject,
         "html": html,
         "text": text_fallback or "Reservation update from The Rambling House.",
     }
-    resp = resend.Emails.send(params)
-    print(f"Resend -> {to_emails}: {resp}")
-    return resp
+
+async def _send_batch(emails: list[dict]) -> None:
+    if emails:
+        await _email_queue.put(emails)
+
+def _retry_delay(resp, attempt: int) -> float:
+    # Honour Retry-After (capped so one event can't stall the queue), else back off exponentially
+    try:
+        return min(float(resp.headers["retry-after"]), 30.0)
+    except (AttributeError, KeyError, ValueError):
+        return float(2 ** attempt)
+
+async def _post_batch(client: AsyncClient, rate: asyncio.Semaphore, batch: list[dict]) -> None:
+    to = [p["to"] for p in batch]
+    # Same key on every attempt so a retried request that actually landed isn't sent twice
+    headers = {**RESEND_HEADERS, "Idempotency-Key": str(uuid.uuid4())}
+    for attempt in range(1, RESEND_MAX_ATTEMPTS + 1):
+        # Token bucket: each API call holds a slot for _RATE_WINDOW seconds
+        await rate.acquire()
+        asyncio.get_running_loop().call_later(_RATE_WINDOW, rate.release)
+        try:
+            resp = await client.post(RESEND_BATCH_URL, headers=headers, json=batch)
+            resp.raise_for_status()
+        except HTTPStatusError as e:
+            status = e.response.status_code
+            if (status != 429 and status < 500) or attempt == RESEND_MAX_ATTEMPTS:
+                log.error("Resend failed -> %s: %s %s", to, status, e.response.text)
+                return
+            delay = _retry_delay(e.response, attempt)
+        except TransportError as e:
+            if attempt == RESEND_MAX_ATTEMPTS:
+                log.error("Resend failed -> %s: %r", to, e)
+                return
+            delay = _retry_delay(None, attempt)
+        except Exception as e:
+            log.error("Resend failed -> %s: %r", to, e)
+            return
+        else:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Resend -> %s: %s", to, resp.text)
+            return
+        log.warning("Resend attempt %d/%d failed -> %s; retrying in %.0fs", attempt, RESEND_MAX_ATTEMPTS, to, delay)
+        await asyncio.sleep(delay)
+
+async def _consume(client: AsyncClient, rate: asyncio.Semaphore) -> None:
+    while True:
+        batch = await _email_queue.get()
+        try:
+            await _post_batch(client, rate, batch)
+        finally:
+            _email_queue.task_done()
+
+async def email_worker(client: AsyncClient) -> None:
+    """Drain the email queue with EMAIL_CONSUMERS tasks, posting each event's emails as one Resend
+    batch call; all consumers share one RESEND_MAX_RPS token bucket."""
+    rate = asyncio.Semaphore(RESEND_MAX_RPS)
+    consumers = [asyncio.create_task(_consume(client, rate)) for _ in range(EMAIL_CONSUMERS)]
+    try:
+        await asyncio.gather(*consumers)
+    finally:
+        # If one consumer dies, stop the rest so main.py restarts a clean pool
+        for task in consumers:
+            task.cancel()
+
+async def flush_emails(timeout: float = 10.0) -> None:
+    """Wait (up to `timeout` seconds) for queued emails to be sent."""
+    try:
+        await asyncio.wait_for(_email_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        log.warning("Dropping %d unsent email batch(es) on shutdown", _email_queue.qsize())
 
 # ---------- Public: called by main.py ----------
 
-def send_reservation_received(reservation: dict) -> None:
+async def send_reservation_received(reservation: dict) -> None:
     """On create (pending): send to customer + admins."""
+    customer = reservation.get("email")
+    if not customer and not ADMIN_RECIPIENTS:
+        return
     details = _details_table(reservation)
-    gcal = _button(_gcal_link(reservation), "Add to Calendar")
-    maps = _button(_maps_link(), "Get Directions", bg="#0a5a36")
+    ref = _ref(reservation.get("id"))
+    emails = []
 
     # Customer
-    ref = _ref(reservation.get("id"))
-    intro_c = (
-        f"<p style='margin:0 0 10px 0;'>Hi <strong>{_s(reservation.get('name'))}</strong>, thanks for booking with us.</p>"
-        f"<p style='margin:0;'>We’ve received your request and it’s now <strong>pending review</strong> by our team. "
-        f"You’ll get another email once we confirm availability.</p>"
-        f"<p style='margin:12px 0 0 0;color:{MUTED}'>What happens next?</p>"
-        f"<ul style='margin:8px 0 0 20px;padding:0;color:{MUTED}'>"
-        "<li>We’ll check tables and confirm ASAP.</li>"
-        "<li>If anything changes, just reply to this email or call us.</li>"
-        "<li>Please arrive a few minutes early so we can seat you comfortably.</li>"
-        "</ul>"
-    )
-    footer_c = (
-        f"<div style='padding:14px 16px;background:{ACCENT_LT};border:1px solid {BORDER};border-radius:10px;'>"
-        f"{gcal}&nbsp;&nbsp;{maps}"
-        "</div>"
-    )
-    html_c = _wrapper_html(
-        title=f"We’ve got your reservation (Ref: {ref})",
-        preheader="Thanks! Your request is pending. We’ll confirm shortly.",
-        intro_html=intro_c,
-        details_html=details,
-        badge="Pending ⏳",
-        extra_footer=footer_c,
-    )
-    _send(reservation["email"], f"📝 Reservation received — Ref {ref}", html_c)
+    if customer:
+        gcal = _button(_gcal_link(reservation), "Add to Calendar")
+        intro_c = (
+            f"<p style='margin:0 0 10px 0;'>Hi <strong>{_s(reservation.get('name'))}</strong>, thanks for booking with us.</p>"
+            f"<p style='margin:0;'>We’ve received your request and it’s now <strong>pending review</strong> by our team. "
+            f"You’ll get another email once we confirm availability.</p>"
+            f"<p style='margin:12px 0 0 0;color:{MUTED}'>What happens next?</p>"
+            f"<ul style='margin:8px 0 0 20px;padding:0;color:{MUTED}'>"
+            "<li>We’ll check tables and confirm ASAP.</li>"
+            "<li>If anything changes, just reply to this email or call us.</li>"
+            "<li>Please arrive a few minutes early so we can seat you comfortably.</li>"
+            "</ul>"
+        )
+        footer_c = (
+            f"<div style='padding:14px 16px;background:{ACCENT_LT};border:1px solid {BORDER};border-radius:10px;'>"
+            f"{gcal}&nbsp;&nbsp;{_MAPS_BUTTON_HTML}"
+            "</div>"
+        )
+        html_c = _wrapper_html(
+            title=f"We’ve got your reservation (Ref: {ref})",
+            preheader="Thanks! Your request is pending. We’ll confirm shortly.",
+            intro_html=intro_c,
+            details_html=details,
+            badge="Pending ⏳",
+            extra_footer=footer_c,
+        )
+        emails.append(_email(customer, f"📝 Reservation received — Ref {ref}", html_c))
 
     # Admin(s)
     if ADMIN_RECIPIENTS:
@@ -250,66 +420,86 @@ def send_reservation_received(reservation: dict) -> None:
             badge="Pending ⏳",
             extra_footer="",
         )
-        _send(
+        emails.append(_email(
             ADMIN_RECIPIENTS,
             f"🆕 Pending booking — { _fmt_date(reservation.get('date')) } { _fmt_time(reservation.get('time')) } · {_s(reservation.get('name'))} · {_s(reservation.get('guests'))}p",
             html_a,
-        )
+        ))
+    await _send_batch(emails)
 
-def send_status_change(reservation: dict) -> None:
-    """On status update: send to customer + admins."""
-    status = (_s(reservation.get("status")) or "").lower()
-    details = _details_table(reservation)
-    gcal = _button(_gcal_link(reservation), "Add to Calendar")
-    maps = _button(_maps_link(), "Get Directions", bg="#0a5a36")
-    ref = _ref(reservation.get("id"))
-
-    if status == "confirmed":
-        subject_c = f"✅ Confirmed — { _fmt_date(reservation.get('date')) } { _fmt_time(reservation.get('time')) } · Ref {ref}"
-        badge = "Confirmed ✅"
-        intro = (
-            f"<p style='margin:0 0 10px 0;'>Hi <strong>{_s(reservation.get('name'))}</strong>, great news!</p>"
+# status -> (customer subject, customer intro, badge); each is a str.format taking
+# name/date/time/ref/status keywords
+_STATUS_TEMPLATES = {
+    "confirmed": (
+        "✅ Confirmed — {date} {time} · Ref {ref}".format,
+        (
+            "<p style='margin:0 0 10px 0;'>Hi <strong>{name}</strong>, great news!</p>"
             "<p style='margin:0;'>Your reservation is <strong>confirmed</strong>. We can’t wait to welcome you.</p>"
             f"<p style='margin:12px 0 0 0;color:{MUTED}'>Good to know:</p>"
             f"<ul style='margin:8px 0 0 20px;padding:0;color:{MUTED}'>"
             "<li>If you’re running late, just give us a call.</li>"
             "<li>Need to adjust your party size or time? Reply to this email.</li>"
             "</ul>"
-        )
-    elif status == "cancelled":
-        subject_c = f"❌ Cancelled — Ref {ref}"
-        badge = "Cancelled ❌"
-        intro = (
-            f"<p style='margin:0 0 10px 0;'>Hi <strong>{_s(reservation.get('name'))}</strong>,</p>"
+        ).format,
+        "Confirmed ✅".format,
+    ),
+    "cancelled": (
+        "❌ Cancelled — Ref {ref}".format,
+        (
+            "<p style='margin:0 0 10px 0;'>Hi <strong>{name}</strong>,</p>"
             "<p style='margin:0;'>Your reservation has been <strong>cancelled</strong>. "
             "If this was a mistake or you need a new time, reply and we’ll help.</p>"
+        ).format,
+        "Cancelled ❌".format,
+    ),
+}
+_DEFAULT_STATUS_TEMPLATE = (
+    "ℹ️ Update — Status: {status} · Ref {ref}".format,
+    (
+        "<p style='margin:0 0 10px 0;'>Hi <strong>{name}</strong>,</p>"
+        "<p style='margin:0;'>Your reservation status is now <strong>{status}</strong>.</p>"
+    ).format,
+    "Status: {status}".format,
+)
+
+async def send_status_change(reservation: dict) -> None:
+    """On status update: send to customer + admins."""
+    customer = reservation.get("email")
+    if not customer and not ADMIN_RECIPIENTS:
+        return
+    status = (_s(reservation.get("status")) or "").lower()
+    details = _details_table(reservation)
+    ref = _ref(reservation.get("id"))
+    name = _s(reservation.get("name"))
+    date = _fmt_date(reservation.get("date"))
+    time = _fmt_time(reservation.get("time"))
+    subject_tmpl, intro_tmpl, badge_tmpl = _STATUS_TEMPLATES.get(status, _DEFAULT_STATUS_TEMPLATE)
+    badge = badge_tmpl(status=status)
+    emails = []
+
+    # Customer
+    if customer:
+        gcal = _button(_gcal_link(reservation), "Add to Calendar")
+        subject_c = subject_tmpl(date=date, time=time, ref=ref, status=status)
+        intro = intro_tmpl(name=name, status=status)
+        footer_cta = (
+            f"<div style='padding:14px 16px;background:{ACCENT_LT};border:1px solid {BORDER};border-radius:10px;'>"
+            f"{gcal}&nbsp;&nbsp;{_MAPS_BUTTON_HTML}"
+            "</div>"
         )
-    else:
-        subject_c = f"ℹ️ Update — Status: {status} · Ref {ref}"
-        badge = f"Status: {status}"
-        intro = (
-            f"<p style='margin:0 0 10px 0;'>Hi <strong>{_s(reservation.get('name'))}</strong>,</p>"
-            f"<p style='margin:0;'>Your reservation status is now <strong>{status}</strong>.</p>"
+        html_c = _wrapper_html(
+            title="Reservation update",
+            preheader="Your booking status has changed.",
+            intro_html=intro,
+            details_html=details,
+            badge=badge,
+            extra_footer=footer_cta,
         )
-
-    footer_cta = (
-        f"<div style='padding:14px 16px;background:{ACCENT_LT};border:1px solid {BORDER};border-radius:10px;'>"
-        f"{gcal}&nbsp;&nbsp;{maps}"
-        "</div>"
-    )
-    html_c = _wrapper_html(
-        title="Reservation update",
-        preheader="Your booking status has changed.",
-        intro_html=intro,
-        details_html=details,
-        badge=badge,
-        extra_footer=footer_cta,
-    )
-    _send(reservation["email"], subject_c, html_c)
+        emails.append(_email(customer, subject_c, html_c))
 
     # Admin(s)
     if ADMIN_RECIPIENTS:
-        subj_a = f"📣 {status.capitalize()} — { _fmt_date(reservation.get('date')) } { _fmt_time(reservation.get('time')) } · {_s(reservation.get('name'))} · {_s(reservation.get('guests'))}p · Ref {ref}"
+        subj_a = f"📣 {status.capitalize()} — {date} {time} · {name} · {_s(reservation.get('guests'))}p · Ref {ref}"
         intro_a = "<p style='margin:0;'>Reservation status changed:</p>"
         html_a = _wrapper_html(
             title=f"Reservation {status.capitalize()}",
@@ -319,4 +509,5 @@ def send_status_change(reservation: dict) -> None:
             badge=badge,
             extra_footer="",
         )
-        _send(ADMIN_RECIPIENTS, subj_a, html_a)
+        emails.append(_email(ADMIN_RECIPIENTS, subj_a, html_a))
+    await _send_batch(emails)
@@ -1,24 +1,28 @@
+import asyncio
 import os
+import time
 from enum import Enum
 from datetime import date
+from hashlib import blake2b
 from uuid import UUID
-from typing import List, Optional, Literal
+from typing import Annotated, List, Optional, Literal
 
+import orjson
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Response, Request
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Query, Response, Request
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
-from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from httpx import AsyncClient, HTTPStatusError, Timeout, ReadTimeout, ConnectTimeout
-from pydantic import BaseModel, EmailStr, Field
-from supabase import create_client, Client
+from jose import jwt, JWTError
+from httpx import AsyncClient, HTTPError, HTTPStatusError, Limits, Timeout, ReadTimeout, ConnectTimeout
+from pydantic import BaseModel, EmailStr, Field, StringConstraints
 
 # Email helpers (Resend)
-from email_utils import send_reservation_received, send_status_change
+from email_utils import send_reservation_received, send_status_change, email_worker, flush_emails
 
 # -------------------- env & clients --------------------
 load_dotenv()
@@ -28,13 +32,15 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")             # service_role key for REST
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")   # anon key for Auth
 if not SUPABASE_URL or not SUPABASE_KEY or not SUPABASE_ANON_KEY:
     raise RuntimeError("SUPABASE_URL, SUPABASE_KEY, SUPABASE_ANON_KEY must be set in .env")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")  # optional: verify access tokens locally
 
-# Supabase auth client (uses anon key)
-sb_auth: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+# Verbose auth/cookie logging (never on under `python -O`)
+DEBUG_AUTH = __debug__ and os.getenv("DEBUG_AUTH") == "1"
 
-# HTTP client with friendlier timeouts
+# HTTP client with friendlier timeouts; HTTP/2 multiplexes concurrent Supabase calls over one connection
 HTTP_TIMEOUT = Timeout(connect=5.0, read=20.0, write=20.0, pool=None)
-client = AsyncClient(timeout=HTTP_TIMEOUT)
+HTTP_LIMITS = Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60.0)
+client = AsyncClient(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS, base_url=SUPABASE_URL)
 
 # Headers (service_role; RLS disabled in your project)
 WRITE_HEADERS = {
@@ -47,14 +53,17 @@ READ_HEADERS = {
     "apikey": SUPABASE_KEY,
     "Authorization": f"Bearer {SUPABASE_KEY}",
     "Accept": "application/json",
-    "Range": "0-9999",  # avoids pagination surprises
 }
+# Paged list reads: PostgREST adds a total to Content-Range (e.g. "0-49/1234"); "estimated"
+# uses the planner's row estimate on large tables instead of a COUNT(*) per page
+PAGED_READ_HEADERS = {**READ_HEADERS, "Prefer": "count=estimated"}
+AUTH_HEADERS = {"apikey": SUPABASE_ANON_KEY}  # Supabase Auth (GoTrue) uses the anon key
 
 # Rate limiting
 limiter = Limiter(key_func=get_remote_address)
 
 # -------------------- FastAPI app --------------------
-app = FastAPI(title="Rambling House Reservations API")
+app = FastAPI(title="Rambling House Reservations API", default_response_class=ORJSONResponse)
 
 # Add rate limiting middleware
 app.state.limiter = limiter
@@ -74,6 +83,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PATCH", "DELETE"],
     allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["Content-Range", "X-Total-Count"],  # paging metadata on list endpoints
 )
 
 # Add SlowAPI middleware
@@ -82,35 +92,82 @@ app.add_middleware(SlowAPIMiddleware)
 # -------------------- security helpers --------------------
 bearer = HTTPBearer(auto_error=False)
 
+# Verified tokens: blake2b(token) -> (expires_at, user)
+AUTH_CACHE_TTL = 60.0
+AUTH_CACHE_MAX = 4096
+_auth_cache: dict[bytes, tuple[float, dict]] = {}
+
+async def _verify_token(token: str) -> dict:
+    """Return {"id", "email"} for a valid Supabase access token; raise otherwise.
+
+    Tokens are checked locally against SUPABASE_JWT_SECRET when it is set, falling
+    back to Supabase Auth; results are cached until AUTH_CACHE_TTL or token expiry.
+    """
+    key = blake2b(token.encode(), digest_size=16).digest()
+    now = time.time()
+    hit = _auth_cache.get(key)
+    if hit and hit[0] > now:
+        return hit[1]
+
+    user = None
+    expires = now + AUTH_CACHE_TTL
+    if SUPABASE_JWT_SECRET:
+        try:
+            claims = jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=["HS256"], audience="authenticated")
+            user = {"id": claims["sub"], "email": claims.get("email")}
+            expires = min(expires, claims["exp"])
+        except (JWTError, KeyError):
+            pass
+    if user is None:
+        resp = await client.get(
+            "/auth/v1/user",
+            headers={**AUTH_HEADERS, "Authorization": f"Bearer {token}"},
+        )
+        resp.raise_for_status()
+        data = orjson.loads(resp.content)
+        user = {"id": data["id"], "email": data.get("email")}
+        # Supabase just accepted the token, so its unverified exp is trustworthy here
+        try:
+            expires = min(expires, jwt.get_unverified_claims(token)["exp"])
+        except (JWTError, KeyError, TypeError):
+            return user  # no readable expiry: don't cache
+
+    if len(_auth_cache) >= AUTH_CACHE_MAX:
+        _auth_cache.pop(next(iter(_auth_cache)))  # drop the oldest entry
+    _auth_cache[key] = (expires, user)
+    return user
+
 async def require_auth(request: Request, credentials: HTTPAuthorizationCredentials = Depends(bearer)):
     token = None
     
     # Debug: Log what we receive
-    print(f"🔍 Auth check - Cookies: {request.cookies}")
-    print(f"🔍 Auth check - Authorization header: {request.headers.get('authorization')}")
+    if DEBUG_AUTH:
+        print(f"🔍 Auth check - Cookies: {request.cookies}")
+        print(f"🔍 Auth check - Authorization header: {request.headers.get('authorization')}")
     
     # Try cookie first, then Authorization header
     if request.cookies.get("auth_token"):
         token = request.cookies.get("auth_token")
-        print(f"🔍 Using cookie token: {token[:20]}...")
+        if DEBUG_AUTH:
+            print(f"🔍 Using cookie token: {token[:20]}...")
     elif credentials:
         token = credentials.credentials
-        print(f"🔍 Using header token: {token[:20]}...")
+        if DEBUG_AUTH:
+            print(f"🔍 Using header token: {token[:20]}...")
     
     if not token:
-        print("❌ No token found")
+        if DEBUG_AUTH:
+            print("❌ No token found")
         raise HTTPException(status_code=401, detail="Missing authentication")
         
     try:
-        res = sb_auth.auth.get_user(token)
-        user = res.user
-        if not user:
-            print("❌ Invalid user from token")
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-        print(f"✅ Auth successful for user: {user.email}")
-        return {"id": user.id, "email": user.email}
+        user = await _verify_token(token)
+        if DEBUG_AUTH:
+            print(f"✅ Auth successful for user: {user['email']}")
+        return user
     except Exception as e:
-        print(f"❌ Auth error: {e}")
+        if DEBUG_AUTH:
+            print(f"❌ Auth error: {e}")
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
 # -------------------- models (match your DB: TEXT for guests/time/status) --------------------
@@ -130,12 +187,18 @@ class ReservationBase(BaseModel):
     special_requests: Optional[str] = Field(None, max_length=500)
 
 class ReservationIn(ReservationBase):
-    pass  # DB default sets status='pending'
+    # DB default sets status='pending'; input is validated and normalised once by pydantic
+    name: Annotated[str, StringConstraints(strip_whitespace=True, min_length=2, max_length=100)]
+    phone: Annotated[str, StringConstraints(strip_whitespace=True, min_length=8)]
+    guests: Annotated[str, StringConstraints(pattern=r"^([1-9]|1\d|20)$")]   # 1-20
 
 class Reservation(ReservationBase):
     id: str
     status: str                 # TEXT in DB
 
+# List endpoints pass Supabase's JSON straight through, so select exactly the Reservation fields
+RESERVATION_COLUMNS = ",".join(Reservation.model_fields)
+
 # ---- auth models (for Swagger / frontend) ----
 class LoginRequest(BaseModel):
     email: EmailStr
@@ -155,29 +218,38 @@ class LoginResponse(BaseModel):
 @limiter.limit("10/minute")  # Rate limit login attempts
 async def login(request: Request, payload: LoginRequest, response: Response):
     try:
-        res = sb_auth.auth.sign_in_with_password(
-            {"email": payload.email, "password": payload.password}
+        resp = await client.post(
+            "/auth/v1/token",
+            params={"grant_type": "password"},
+            json={"email": payload.email, "password": payload.password},
+            headers=AUTH_HEADERS,
         )
-        if not res.session or not res.session.access_token:
+        resp.raise_for_status()
+        session = orjson.loads(resp.content)
+        access_token = session.get("access_token")
+        if not access_token:
             raise HTTPException(status_code=401, detail="Invalid email or password")
+        user = session.get("user")
         
         # Set httpOnly cookie
-        print(f"🍪 Setting cookie with token: {res.session.access_token[:20]}...")
+        if DEBUG_AUTH:
+            print(f"🍪 Setting cookie with token: {access_token[:20]}...")
         response.set_cookie(
             key="auth_token",
-            value=res.session.access_token,
+            value=access_token,
             httponly=True,
             secure=False,  # Set to True in production with HTTPS
             samesite="lax",
             max_age=3600,  # 1 hour
             domain=None  # Allow cookie to work on localhost and 127.0.0.1
         )
-        print(f"🍪 Cookie set in response headers: {response.headers}")
+        if DEBUG_AUTH:
+            print(f"🍪 Cookie set in response headers: {response.headers}")
         
         return LoginResponse(
-            access_token=res.session.access_token,
+            access_token=access_token,
             token_type="bearer",
-            user=UserInfo(id=res.user.id, email=res.user.email) if res.user else None,
+            user=UserInfo(id=user["id"], email=user["email"]) if user else None,
         )
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid email or password")
@@ -191,17 +263,11 @@ async def login(request: Request, payload: LoginRequest, response: Response):
 )
 @limiter.limit("5/minute")  # Rate limit reservation creation
 async def create_reservation(request: Request, res: ReservationIn, background_tasks: BackgroundTasks):
-    # Additional validation
-    if not res.name.strip() or len(res.name.strip()) < 2:
-        raise HTTPException(status_code=400, detail="Name must be at least 2 characters")
-    if not res.phone.strip() or len(res.phone.strip()) < 8:
-        raise HTTPException(status_code=400, detail="Phone number must be at least 8 digits")
-    if not res.guests or not res.guests.isdigit() or int(res.guests) < 1 or int(res.guests) > 20:
-        raise HTTPException(status_code=400, detail="Guests must be between 1 and 20")
-    payload = jsonable_encoder({**res.dict(), "status": StatusEnum.pending})
+    payload = res.model_dump(mode="json")
+    payload["status"] = StatusEnum.pending.value
     try:
         resp = await client.post(
-            f"{SUPABASE_URL}/rest/v1/reservations",
+            "/rest/v1/reservations",
             params={"select": "*"},
             json=payload,
             headers=WRITE_HEADERS,
@@ -212,10 +278,11 @@ async def create_reservation(request: Request, res: ReservationIn, background_ta
     except HTTPStatusError:
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
 
-    data = resp.json()
+    data = orjson.loads(resp.content)
     if not data:
         raise HTTPException(500, "Empty response from Supabase")
     created = data[0]
+    _invalidate_admin_cache()
 
     try:
         background_tasks.add_task(send_reservation_received, created)
@@ -231,13 +298,13 @@ async def create_reservation(request: Request, res: ReservationIn, background_ta
 )
 async def get_reservations(email: EmailStr):
     params = {
-        "select": "*",
+        "select": RESERVATION_COLUMNS,
         "email": f"eq.{email}",
         "order": "date.asc,time.asc",
     }
     try:
         resp = await client.get(
-            f"{SUPABASE_URL}/rest/v1/reservations",
+            "/rest/v1/reservations",
             params=params,
             headers=READ_HEADERS,
         )
@@ -246,7 +313,18 @@ async def get_reservations(email: EmailStr):
         raise HTTPException(status_code=504, detail="Timed out contacting database.")
     except HTTPStatusError:
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
-    return resp.json()
+    return Response(content=resp.content, media_type="application/json")
+
+def _page_headers(resp) -> dict:
+    """Forward PostgREST's Content-Range, plus its total as X-Total-Count."""
+    content_range = resp.headers.get("content-range")
+    if not content_range:
+        return {}
+    headers = {"Content-Range": content_range}
+    total = content_range.rpartition("/")[2]
+    if total.isdigit():
+        headers["X-Total-Count"] = total
+    return headers
 
 @app.get(
     "/reservations/status/{status}",
@@ -254,24 +332,53 @@ async def get_reservations(email: EmailStr):
     summary="List reservations by status (auth required)",
     dependencies=[Depends(require_auth)],
 )
-async def get_by_status(status: StatusEnum):
+async def get_by_status(
+    status: StatusEnum,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
     params = {
-        "select": "*",
+        "select": RESERVATION_COLUMNS,
         "status": f"eq.{status.value}",
-        "order": "date.asc,time.asc",
+        "order": "date.desc,time.desc,id.desc",
+        "limit": str(limit),
+        "offset": str(offset),
     }
     try:
         resp = await client.get(
-            f"{SUPABASE_URL}/rest/v1/reservations",
+            "/rest/v1/reservations",
             params=params,
-            headers=READ_HEADERS,
+            headers=PAGED_READ_HEADERS,
         )
         resp.raise_for_status()
     except (ReadTimeout, ConnectTimeout):
         raise HTTPException(status_code=504, detail="Timed out contacting database.")
     except HTTPStatusError:
+        if resp.status_code == 416:  # offset past the last row: just an empty page
+            return Response(content=b"[]", media_type="application/json", headers=_page_headers(resp))
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
-    return resp.json()
+    return Response(content=resp.content, media_type="application/json", headers=_page_headers(resp))
+
+# Admin dashboard polls this list; cache the raw body per filter for a couple of seconds.
+# Entries: key -> (expires_at, version, body, headers); writes bump the version so stale bodies are ignored.
+ADMIN_CACHE_TTL = 2.0
+ADMIN_CACHE_MAX = 256
+_admin_cache: dict[tuple, tuple[float, int, bytes, dict]] = {}
+_admin_cache_version = 0
+
+def _invalidate_admin_cache() -> None:
+    global _admin_cache_version
+    _admin_cache_version += 1
+    _admin_cache.clear()
+
+def _admin_cache_put(key: tuple, version: int, body: bytes, headers: dict) -> None:
+    now = time.monotonic()
+    if len(_admin_cache) >= ADMIN_CACHE_MAX:
+        for k in [k for k, (exp, ver, *_) in _admin_cache.items() if exp <= now or ver != _admin_cache_version]:
+            del _admin_cache[k]
+        while len(_admin_cache) >= ADMIN_CACHE_MAX:
+            _admin_cache.pop(next(iter(_admin_cache)))  # drop the oldest entry
+    _admin_cache[key] = (now + ADMIN_CACHE_TTL, version, body, headers)
 
 @app.get(
     "/admin/reservations",
@@ -279,22 +386,44 @@ async def get_by_status(status: StatusEnum):
     summary="List ALL reservations (auth required)",
     dependencies=[Depends(require_auth)],
 )
-async def list_all_reservations(status: Optional[StatusEnum] = None):
-    params = {"select": "*", "order": "date.asc,time.asc"}
+async def list_all_reservations(
+    status: Optional[StatusEnum] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    key = (status, limit, offset)
+    hit = _admin_cache.get(key)
+    if hit:
+        if hit[0] > time.monotonic() and hit[1] == _admin_cache_version:
+            return Response(content=hit[2], media_type="application/json", headers=hit[3])
+        del _admin_cache[key]
+    version = _admin_cache_version
+
+    params = {
+        "select": RESERVATION_COLUMNS,
+        "order": "date.desc,time.desc,id.desc",
+        "limit": str(limit),
+        "offset": str(offset),
+    }
     if status:
         params["status"] = f"eq.{status.value}"
     try:
         resp = await client.get(
-            f"{SUPABASE_URL}/rest/v1/reservations",
+            "/rest/v1/reservations",
             params=params,
-            headers=READ_HEADERS,
+            headers=PAGED_READ_HEADERS,
         )
         resp.raise_for_status()
     except (ReadTimeout, ConnectTimeout):
         raise HTTPException(status_code=504, detail="Timed out contacting database.")
     except HTTPStatusError:
+        if resp.status_code == 416:  # offset past the last row: just an empty page
+            return Response(content=b"[]", media_type="application/json", headers=_page_headers(resp))
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
-    return resp.json()
+    headers = _page_headers(resp)
+    if version == _admin_cache_version:
+        _admin_cache_put(key, version, resp.content, headers)
+    return Response(content=resp.content, media_type="application/json", headers=headers)
 
 # ---- PATCH uses UUID and WHERE via params ----
 class StatusUpdateBody(BaseModel):
@@ -307,10 +436,10 @@ class StatusUpdateBody(BaseModel):
     dependencies=[Depends(require_auth)],
 )
 async def update_status(res_id: UUID, body: StatusUpdateBody, background_tasks: BackgroundTasks):
-    payload = jsonable_encoder({"status": body.status})
+    payload = {"status": body.status.value}
     try:
         resp = await client.patch(
-            f"{SUPABASE_URL}/rest/v1/reservations",
+            "/rest/v1/reservations",
             params={"id": f"eq.{str(res_id)}", "select": "*"},
             json=payload,
             headers=WRITE_HEADERS,
@@ -321,11 +450,12 @@ async def update_status(res_id: UUID, body: StatusUpdateBody, background_tasks:
     except HTTPStatusError:
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
 
-    data = resp.json()
+    data = orjson.loads(resp.content)
     if not data:
         raise HTTPException(404, f"Reservation {res_id} not found")
 
     updated = data[0]
+    _invalidate_admin_cache()
 
     if body.status in (StatusEnum.confirmed, StatusEnum.cancelled):
         try:
@@ -345,10 +475,10 @@ class SubscriberIn(BaseModel):
 )
 @limiter.limit("5/minute")  # Rate limit newsletter subscription
 async def add_subscriber(request: Request, sub: SubscriberIn):
-    payload = jsonable_encoder({"email": sub.email})
+    payload = sub.model_dump(mode="json")
     try:
         resp = await client.post(
-            f"{SUPABASE_URL}/rest/v1/subscribers",
+            "/rest/v1/subscribers",
             params={"select": "*"},
             json=payload,
             headers=WRITE_HEADERS,
@@ -360,7 +490,7 @@ async def add_subscriber(request: Request, sub: SubscriberIn):
             raise HTTPException(status_code=409, detail="Already subscribed")
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
 
-    data = resp.json()
+    data = orjson.loads(resp.content)
     if not data:
         raise HTTPException(500, "Failed to subscribe")
     return {"message": "Subscription successful", "subscriber": data[0]}
@@ -377,12 +507,39 @@ async def check_auth(request: Request):
     token = request.cookies.get("auth_token")
     if token:
         try:
-            res = sb_auth.auth.get_user(token)
-            return {"authenticated": True, "user": {"id": res.user.id, "email": res.user.email}}
+            return {"authenticated": True, "user": await _verify_token(token)}
         except Exception:
             return {"authenticated": False, "error": "Invalid token"}
     return {"authenticated": False, "error": "No token found"}
 
+def _start_email_worker() -> None:
+    task = asyncio.create_task(email_worker(client))
+    task.add_done_callback(_on_email_worker_done)
+    app.state.email_worker = task
+
+def _on_email_worker_done(task: asyncio.Task) -> None:
+    # Cancelled only on shutdown; anything else means queued emails would never drain
+    if task.cancelled():
+        return
+    print(f"Email worker stopped unexpectedly ({task.exception()!r}); restarting")
+    _start_email_worker()
+
+@app.on_event("startup")
+async def startup_event():
+    _start_email_worker()
+    # Pre-warm the TLS + HTTP/2 connection to Supabase
+    try:
+        await client.get("/rest/v1/reservations", params={"select": "id", "limit": "1"}, headers=READ_HEADERS)
+    except HTTPError as e:
+        print(f"Supabase warm-up failed: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_event():
+    await flush_emails()
+    app.state.email_worker.cancel()
     await client.aclose()
+
+if __name__ == "__main__":
+    # Same as: uvicorn main:app --loop uvloop --http httptools (both ship with uvicorn[standard])
+    import uvicorn
+    uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), loop="uvloop", http="httptools")